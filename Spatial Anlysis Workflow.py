@@ -2,20 +2,37 @@
 
 # Import Libraries
 import ee
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import pandas as pd
 import numpy as np
-import requests
-from rasterio.io import MemoryFile
-import pylandstats as pls
 from tqdm import tqdm
 import warnings
+from functools import lru_cache
+
+# Landscape metric functions from 'landscape_metrics.py' (in the same folder as this workflow)
+from landscape_metrics import forest_metrics, contagion
 
 # Supress runtime warnings for a cleaner output
 warnings.filterwarnings("ignore")
 
 # Initialise and access my Google Earth Engine Project and session
+# The high-volume endpoint is used as sites are processed with many requests in parallel
+# Documentation - https://developers.google.com/earth-engine/cloud/highvolume
+PROJECT_ID = 'PROJECT ID'
+HIGH_VOLUME_URL = 'https://earthengine-highvolume.googleapis.com'
+
 ee.Authenticate()
-ee.Initialize(project='PROJECT ID')
+ee.Initialize(project=PROJECT_ID, opt_url=HIGH_VOLUME_URL)
+
+# Number of workers used to process sites concurrently
+N_WORKERS = 25
+
+# Process sites in worker processes (True) or worker threads (False).
+# Worker processes need the 'fork' start method (default on Linux), as this workflow is not importable
+# by 'spawn' workers. Elsewhere, such as Jupyter Notebooks on Windows/macOS, threads are used instead.
+# Sites mostly wait on network requests, so threads still overlap well
+USE_PROCESSES = multiprocessing.get_start_method() == 'fork'
 
 # Load pre-processed dataset as .csv (from local storage)
 df = pd.read_csv("INPUT_DATASET")
@@ -35,6 +52,13 @@ landuse_mapping = {
     220: 10
 }
 
+# Lookup table version of the remapping, applied locally to the downloaded GLC raster.
+# GLC class values fit in 8 bits, so indexing the 256 entry table with the raster remaps every pixel at once.
+# Unmapped values (including 0 for no data) stay as 0
+landuse_lut = np.zeros(256, dtype=np.uint8)
+for glc_class, basic_class in landuse_mapping.items():
+    landuse_lut[glc_class] = basic_class
+
 # Defining the names of each of these classes
 basic_class_names = {
     1: "Arable land/Crops",
@@ -49,17 +73,43 @@ basic_class_names = {
     10: "Snow/Ice"
 }
 
+# Create dictionary for new buffers sizes for spatial analysis statistics
+stats_buffers = {
+    '1km': 1000,
+    '2.5km': 2500,
+    '5km': 5000,
+    '10km': 10000
+}
+
+# Output columns and their data types (one row per site and stats buffer).
+# 'process_site' returns each row as a tuple of values in this column order
+result_dtypes = {
+    'ID': np.int64,
+    'Stats Buffer': object,
+    'GLC Image ID': object,
+    'GLC Image Band': object,
+    'Forest Patch Density': np.float64,
+    'Forest Edge Density': np.float64,
+    'Forest Mean Patch Area (ha)': np.float64,
+    'Forest Largest Patch Index': np.float64,
+    'Contagion': np.float64,
+    **{f'{name} %': np.float64 for name in basic_class_names.values()}
+}
+
 # Function to generate a classified GLC image for a given buffer and band
 def classify_glc(glc_collection, glc_band_name, buffer):
     '''
-    Generates a landcover raster with remapped classes and clipped to the site location and buffer:
+    Generates a landcover raster clipped to the site location and buffer:
     
     Steps:
     - Filters GLC_FCS30D image with the buffer boundary
     - Selects the necessary 'band' (representing different years) for the study year
     - In scenarios where the buffer is on the boundary of a GLC tile, a mosiac is created
-    - Remapping of the 35 numeric class values to simplified named values
     - Clips to study buffer
+    - Casts to 8-bit integers (GLC class values fit in 0-255) to keep the downloaded GeoTIFF small
+
+    The 35 numeric class values are remapped to the simplified classes locally after download
+    with 'landuse_lut', rather than with .remap() in GEE
 
     Args:
     - glc_collection - GLC image collection filtered for date
@@ -67,30 +117,202 @@ def classify_glc(glc_collection, glc_band_name, buffer):
     - buffer - Earth Engine geometry representing the study site buffer
 
     Returns:
-    - A classified land cover scene from the GLC dataset for the study year (or closest year to), 
-    rempped and clipped to study site
+    - A land cover scene from the GLC dataset for the study year (or closest year to), 
+    clipped to study site
     '''
     return (
         glc_collection.filterBounds(buffer).mosaic()
         .select(glc_band_name)
-        .remap(list(landuse_mapping.keys()), list(landuse_mapping.values()))
         .rename("classification")
         .clip(buffer)
+        .toUint8()
     )
 
-# Create list to store results in for output dataframe
-all_results = []
+# Approximate length of one degree of latitude in metres (WGS84)
+METRES_PER_DEGREE = 111320
 
-# MAIN LOOP FOR ANALYSIS
+# Native GLC_FCS30D pixel size in degrees (30m at the equator) in both axes. Sites are downloaded on
+# this grid, with pixel edges at multiples of it, which is the grid getDownloadURL(scale=30) returned
+GLC_PIXEL_DEGREES = 0.00026949458523585647
+
+# Function to load a GLC image collection, cached so it is created once per worker rather than per site
+@lru_cache(maxsize=4)
+def get_collection(collection_path):
+    '''
+    Loads a GLC_FCS30D image collection:
+
+    Args:
+    - collection_path - Earth Engine asset path of the image collection
+
+    Returns:
+    - The Earth Engine image collection
+    '''
+    return ee.ImageCollection(collection_path)
+
+# Function to select the GLC dataset and band for a study year
+def resolve_year(year):
+    '''
+    Selects the GLC_FCS30D collection and band representing a study year (or closest year to):
+
+    Collection code source - https://gee-community-catalog.org/projects/glc_fcs/
+
+    Args:
+    - year - Study year
+
+    Returns:
+    - Tuple of (collection path, band name, GLC image ID label) for the study year
+    '''
+    if year >= 2000: # Select annual datasets from year 2000 onwards
+        collection_path = "projects/sat-io/open-datasets/GLC-FCS30D/annual"
+        band_index = year - 1999
+        glc_band_name = f"b{band_index}"
+        training_id = f"GLC Annual {year}"
+    else:
+        if year >= 1997: # Between years 1997 - 1999, Select year 2000 annual data as the closest year
+            collection_path = "projects/sat-io/open-datasets/GLC-FCS30D/annual"
+            glc_band_name = "b1"
+            training_id = "GLC Annual 2000"
+        else:
+            five_years = [1985, 1990, 1995] # For earlier years, use the closest five-year interval dataset
+            closest_year = min(five_years, key=lambda y: abs(year - y))
+            band_map = {1985: 'b1', 1990: 'b2', 1995: 'b3'}
+            glc_band_name = band_map[closest_year]
+            collection_path = "projects/sat-io/open-datasets/GLC-FCS30D/five-years-map"
+            training_id = f"GLC Five-Year {closest_year}"
+
+    return collection_path, glc_band_name, training_id
+
+# Function to define the pixel grid of the raster downloaded for a study site
+def site_grid(lon, lat, half_rows, half_cols):
+    '''
+    Defines the pixel grid of the raster downloaded for a study site, calculated locally (client side):
+
+    The grid is the native GLC_FCS30D grid (EPSG:4326, 'GLC_PIXEL_DEGREES' in both axes), so pixels
+    are not resampled, with the native pixel containing the study site as the centre pixel
+
+    Args:
+    - lon, lat - Coordinates of the study site
+    - half_rows, half_cols - Number of pixels above/below and left/right of the centre pixel
+
+    Returns:
+    - Dictionary of the pixel grid for ee.data.computePixels
+    '''
+    # Native pixel (row and column counted from 0 degrees) containing the study site
+    centre_col = np.floor(lon / GLC_PIXEL_DEGREES)
+    centre_row = np.floor(lat / GLC_PIXEL_DEGREES)
+    return {
+        'dimensions': {'width': 2 * half_cols + 1, 'height': 2 * half_rows + 1},
+        'affineTransform': {
+            'scaleX': GLC_PIXEL_DEGREES,
+            'shearX': 0,
+            'translateX': (centre_col - half_cols) * GLC_PIXEL_DEGREES,
+            'shearY': 0,
+            'scaleY': -GLC_PIXEL_DEGREES,
+            'translateY': (centre_row + 1 + half_rows) * GLC_PIXEL_DEGREES
+        },
+        'crsCode': 'EPSG:4326'
+    }
+
+# Function to calculate the distance of each downloaded pixel from the study site
+def pixel_distances(half_rows, half_cols, pixel_height, pixel_width):
+    '''
+    Calculates the distance (in metres) of every pixel centre in a downloaded raster from the centre pixel:
+
+    Args:
+    - half_rows, half_cols - Number of pixels above/below and left/right of the centre pixel (study site),
+    see 'site_grid'
+    - pixel_height, pixel_width - Pixel height and width in metres
+
+    Returns:
+    - Array the same shape as the raster with the distance of each pixel to the study site in metres
+    '''
+    rows, cols = np.indices((2 * half_rows + 1, 2 * half_cols + 1))
+    return np.hypot((rows - half_rows) * pixel_height, (cols - half_cols) * pixel_width)
+
+# Pixel size in metres used for the landscape metrics (as with pylandstats res=(30, 30) originally)
+pixel_size = 30
+
+# Number of land use classes, including 0 (no data)
+n_classes = len(basic_class_names) + 1
+
+# Function to calculate the pixel windows and circular masks of the stats buffers at a latitude.
+# Cached so sites at the same latitude (rounded to 0.01 degrees) share them rather than
+# rebuilding the distance grid for every site
+@lru_cache(maxsize=16)
+def buffer_layout(lat):
+    '''
+    Calculates the size of the raster covering the largest buffer, and the pixel window and circular mask
+    of each stats buffer within it, for a study site at the given latitude:
+
+    Native GLC pixels are a fixed size in degrees, so their width in metres shrinks with latitude.
+    Pixel sizes are converted to metres at the site latitude (equirectangular approximation, accurate
+    over a 10km buffer), and distances are measured from the centre of the pixel containing the site.
+    The returned arrays are shared between sites, so are not modified
+
+    Args:
+    - lat - Latitude of the study site
+
+    Returns:
+    - Tuple of (half_rows, half_cols, buffer_windows, buffer_pixel_offsets), where half_rows/half_cols
+    are the number of pixels either side of the centre pixel (see 'site_grid'), buffer_windows maps each
+    buffer label to (window, circular mask), and buffer_pixel_offsets is the offset of each pixel used to
+    count land use classes for all buffers in one bincount (see 'process_site')
+    '''
+    pixel_height = GLC_PIXEL_DEGREES * METRES_PER_DEGREE
+    pixel_width = pixel_height * np.cos(np.radians(lat))
+    max_radius = max(stats_buffers.values())
+    half_rows = int(np.ceil(max_radius / pixel_height))
+    half_cols = int(np.ceil(max_radius / pixel_width))
+    distances_10km = pixel_distances(half_rows, half_cols, pixel_height, pixel_width)
+
+    # Each buffer only reads the window of the 10km raster covering it
+    buffer_windows = {}
+    for buffer_label, buffer_radius in stats_buffers.items():
+        buffer_half_rows = int(np.ceil(buffer_radius / pixel_height))
+        buffer_half_cols = int(np.ceil(buffer_radius / pixel_width))
+        window = (
+            slice(half_rows - buffer_half_rows, half_rows + buffer_half_rows + 1),
+            slice(half_cols - buffer_half_cols, half_cols + buffer_half_cols + 1)
+        )
+        buffer_windows[buffer_label] = (window, distances_10km[window] <= buffer_radius)
+
+    # Each pixel is assigned to the smallest buffer containing it, with pixels outside all buffers last
+    buffer_radii = np.array(list(stats_buffers.values()))
+    # Stored as 8-bit integers (offsets fit in 0-255) to keep the cached arrays small
+    buffer_pixel_offsets = (np.searchsorted(buffer_radii, distances_10km) * n_classes).astype(np.uint8)
+
+    return half_rows, half_cols, buffer_windows, buffer_pixel_offsets
+
+# Function to initialise Earth Engine in each worker process
+def init_worker():
+    '''
+    Initialises the Earth Engine session for a worker process in the multiprocessing pool:
 
-# Loop through each study site with tqdm for progress bar in output (for Jupyter environments)
-for index, row in tqdm(df.iterrows(), total=len(df), desc="Processing sites"):
+    Each worker process needs its own Earth Engine session, which is pointed at the
+    high-volume endpoint as requests are sent from many workers at once.
+    '''
+    ee.Initialize(project=PROJECT_ID, opt_url=HIGH_VOLUME_URL)
+
+# Function to run the spatial analysis for a single study site
+def process_site(site):
+    '''
+    Calculates the land use and forest landscape metrics for one study site across all stats buffers:
+
+    Args:
+    - site - Tuple of (IDs, Longitude, Latitude, Study Year), where IDs is a tuple of the IDs of all
+    rows of the input dataset at the same location using the same GLC image
+
+    Returns:
+    - A list of result rows (tuples in 'result_dtypes' column order), one for each stats buffer and ID.
+    Failed sites print an error message and return the buffers completed before the failure
+    '''
+    site_results = []
     try:
         # Extract study site info
-        site_id = int(row['ID'])
-        lon = float(row['Longitude'])
-        lat = float(row['Latitude'])
-        year = int(row['Study Year'])
+        site_ids = [int(site_id) for site_id in site[0]]
+        lon = float(site[1])
+        lat = float(site[2])
+        year = int(site[3])
 
         # Define GEE point geometry for study site location
         study_site = ee.Geometry.Point([lon, lat])
@@ -98,149 +320,150 @@ for index, row in tqdm(df.iterrows(), total=len(df), desc="Processing sites"):
         # Define study area (10km buffer)
         buffer_10km = study_site.buffer(10000)  
 
+        # Pixel windows and circular masks of the stats buffers at the site latitude.
+        # Latitude is rounded to 0.01 degrees for the cache, which moves the buffer edges by under 2m
+        half_rows, half_cols, buffer_windows, buffer_pixel_offsets = buffer_layout(round(lat, 2))
+
         # GLC DATA COLLECTION
-        # Collection code source - https://gee-community-catalog.org/projects/glc_fcs/
+        # Look up the GLC collection and band for the study year (see 'resolve_year')
+        collection_path, glc_band_name, training_id = year_map[year]
+        glc_collection = get_collection(collection_path)
 
-        if year >= 2000: # Select annual datasets from year 2000 onwards
-            glc_collection = ee.ImageCollection("projects/sat-io/open-datasets/GLC-FCS30D/annual")
-            band_index = year - 1999
-            glc_band_name = f"b{band_index}"
-            training_id = f"GLC Annual {year}"
-        else:
-            if year >= 1997: # Between years 1997 - 1999, Select year 2000 annual data as the closest year
-                glc_collection = ee.ImageCollection("projects/sat-io/open-datasets/GLC-FCS30D/annual")
-                glc_band_name = "b1"
-                training_id = "GLC Annual 2000"
-            else:
-                five_years = [1985, 1990, 1995] # For earlier years, use the closest five-year interval dataset
-                closest_year = min(five_years, key=lambda y: abs(year - y))
-                band_map = {1985: 'b1', 1990: 'b2', 1995: 'b3'}
-                glc_band_name = band_map[closest_year]
-                glc_collection = ee.ImageCollection("projects/sat-io/open-datasets/GLC-FCS30D/five-years-map")
-                training_id = f"GLC Five-Year {closest_year}"
-
-        # Use 'classify_glc' function to create clipped and remapped GLC raster for the study site
+        # Use 'classify_glc' function to create clipped GLC raster for the study site
         classified = classify_glc(glc_collection, glc_band_name, buffer_10km)
 
-        # Create dictionary for new buffers sizes for spatial analysis statistics
-        stats_buffers = {
-            '1km': 1000,
-            '2.5km': 2500,
-            '5km': 5000,
-            '10km': 10000
-        }
+        # Download the 10km classified image once in local memory to calculate landscape metrics.
+        # The 10km raster covers all of the smaller buffers, which are cut out of it locally below,
+        # so only one raster is downloaded per site.
+        # Pixels are returned directly as a NumPy array with computePixels, rather than downloading
+        # and decoding a GeoTIFF, on the native GLC grid (see 'site_grid').
+        # Pixels outside the buffer are masked and returned as 0 (no data).
+        # Documentation - https://developers.google.com/earth-engine/apidocs/ee-data-computepixels
+
+        # Requests throttled by GEE (429, when many sites are processed at once), server errors (5xx)
+        # and connection errors are already retried with exponential backoff by the Earth Engine client
+        # (up to 5 times by default, see ee.data.setMaxRetries), so no retry loop is needed here.
+        # Other errors fail the site straight away
+        pixels = ee.data.computePixels({
+            'expression': classified,
+            'fileFormat': 'NUMPY_NDARRAY',
+            'grid': site_grid(lon, lat, half_rows, half_cols)
+        })
+
+        # Remap GLC classes to the simplified classes with the lookup table
+        classified_np_10km = landuse_lut[pixels['classification']]
+
+        # Count land use class pixels for all buffer sizes in a single pass over the 10km raster.
+        # Each pixel is assigned to the smallest buffer containing it, pixels are counted per
+        # (buffer, class) pair with one bincount, and the counts are summed outwards across buffers.
+        # Class 0 is no data (outside buffer), so is counted but excluded from percentages below
+        pair_counts = np.bincount(
+            (buffer_pixel_offsets + classified_np_10km).ravel(),
+            minlength=(len(stats_buffers) + 1) * n_classes
+        ).reshape(len(stats_buffers) + 1, n_classes)
+        # Last row holds pixels outside of all buffers and is dropped
+        buffer_class_counts = dict(zip(stats_buffers, np.cumsum(pair_counts[:-1], axis=0)))
 
         # Loop through the differet buffer sizes 
-        for buffer_label, buffer_radius in stats_buffers.items():
-            # Create buffer geometry from new buffer sizes for each location
-            stats_buffer = study_site.buffer(buffer_radius)
-
-            # Calculate land use class distribution histogram in buffer area
-            # Using Earth Engine's frequencyHistogram reducer for pixel value count
-            # https://developers.google.com/earth-engine/tutorials/community/introduction-to-dynamic-world-pt-1
-            histogram = classified.reduceRegion(
-                reducer=ee.Reducer.frequencyHistogram(),
-                geometry=stats_buffer,
-                scale=30,
-                maxPixels=1e9,
-                bestEffort=True
-            ).get('classification').getInfo() or {}
-
-            # Download classified image for landscape metrics in local memory in order to use 'pylandstats' 
-            url = classified.getDownloadURL({
-                'scale': 30,
-                'region': stats_buffer.bounds().getInfo(),
-                'maxPixels': 1e9,
-                'filePerBand': False,
-                'format': 'GeoTIFF'
-            })
-            response = requests.get(url)
-
-            # Read downloaded GeoTIFF directly into memory using rasterio.MemoryFile
-            # to writing temporary files to disk and so improves efficiency.
-            # Documentation - https://rasterio.readthedocs.io/en/stable/topics/memory-files.html
-
-            # Loop for retries added for scenarios where rasterio fails to read the GeoTIFF correctly
-            # resulting in failed site. Tries up to 3 times before moving on
-            for attempt in range(3):
-                try:
-                    response = requests.get(url)
-                    with MemoryFile(response.content) as memfile:
-                        with memfile.open() as dataset:
-                            classified_np = dataset.read(1)
-                    break  # Success = break loop
-                except Exception:
-                    # after 3rd failure move on
-                    if attempt == 2:
-                        raise  
-
-            pixel_size = 30
-            pixel_area = pixel_size * pixel_size
-
-            # Calculate landscape metrics with pylandstats library
-            # Metrics used include; patch density, edge density, mean patch area, largest patch index, contagion
-            # Documentation at - https://pylandstats.readthedocs.io/en/latest/landscape.html 
-            landscape = pls.Landscape(classified_np, res=(pixel_size, pixel_size))
-            metrics_df = landscape.compute_class_metrics_df()
-            contagion_val = landscape.contagion() 
-                    
-            # Extract forest metrics (class 2)
-            forest_class = 2
-            if forest_class in metrics_df.index:
-                forest_metrics = metrics_df.loc[forest_class]
-                pd_val = forest_metrics['patch_density']
-                ed_val = forest_metrics['edge_density']
-                # Convert mean patch area from pixels to hectares (1 ha = 10,000 m^2)
-                mpa_val = (forest_metrics['area_mn'] * pixel_area) / 10000 
-                lpi_val = forest_metrics['largest_patch_index']
-            else:
-                # If metrics aren't calculable, default to 0.0 
-                pd_val = ed_val = mpa_val = lpi_val = 0.0
-
-            # Add results for current site metadata and buffer metrics to dictionary
-            summary = {
-                'ID': site_id,
-                'Stats Buffer': buffer_label,
-                'GLC Image ID': training_id,
-                'GLC Image Band': glc_band_name,
-                'Forest Patch Density': pd_val,
-                'Forest Edge Density': ed_val,
-                'Forest Mean Patch Area (ha)': mpa_val,
-                'Forest Largest Patch Index': lpi_val,
-                'Contagion': round(contagion_val, 2)
-            }
-
-            # Calculate percentage cover of each land use class from histogram counts
+        for buffer_label in stats_buffers:
+            # Cut the window around the study site covering the buffer out of the 10km raster,
+            # and mask pixels outside of the circular buffer as 0 (no data)
+            window, buffer_mask = buffer_windows[buffer_label]
+            classified_np = np.where(buffer_mask, classified_np_10km[window], 0)
+
+            # Calculate forest landscape metrics (class 2)
+            # Metrics used include; patch density, edge density, mean patch area, largest patch index
+            pd_val, ed_val, mpa_val, lpi_val = forest_metrics(classified_np, pixel_size)
+
+            # Calculate contagion of all land use classes
+            contagion_val = contagion(classified_np, buffer_class_counts[buffer_label])
+
+            # Calculate percentage cover of each land use class from pixel counts of the downloaded raster.
+            # Counting locally replaces a separate frequencyHistogram reduceRegion call to GEE per buffer
             # https://developers.google.com/earth-engine/tutorials/community/introduction-to-dynamic-world-pt-2
-            if histogram:
-                total_pixels = sum(histogram.values())
-                for class_str, count in histogram.items():
-                    class_id = int(class_str)
-                    percent_cover = (count / total_pixels) * 100
-                    landuse_name = basic_class_names[class_id]
-                    summary[f'{landuse_name} %'] = percent_cover
-
-            # Ensure all landuse classes are represented in output (0% if not present)
-            for class_id, name in basic_class_names.items():
-                key = f"{name} %"
-                if key not in summary:
-                    summary[key] = 0.0
-
-            # Round all float values to 2 decimal places
-            for key, value in summary.items():
-                if isinstance(value, float):
-                    summary[key] = round(value, 2)
-
-            # Append the summary dictionary to results list
-            all_results.append(summary)
-
-     # Print error message for any failed iteration but continue processing next sites
+            counts = buffer_class_counts[buffer_label]
+            total_pixels = counts[1:].sum()
+            # Classes not present (or an empty buffer) are given 0% cover
+            percent_covers = (
+                100.0 * counts[1:] / total_pixels if total_pixels else np.zeros(len(basic_class_names))
+            )
+
+            # Results for current site metadata and buffer metrics (without ID), in 'result_dtypes' order
+            buffer_values = (
+                buffer_label,
+                training_id,
+                glc_band_name,
+                pd_val,
+                ed_val,
+                mpa_val,
+                lpi_val,
+                contagion_val,
+                *percent_covers.tolist()
+            )
+
+            # Append a result row for each ID at the site to the site results list
+            site_results.extend((site_id, *buffer_values) for site_id in site_ids)
+
+    # Print error message for any failed site but continue processing next sites
     except Exception as e:
-        print(f"Failed on ID {row['ID']}: {str(e)}")
-        continue
+        print(f"Failed on ID {', '.join(str(site_id) for site_id in site[0])}: {str(e)}")
 
-# Convert list of result dictionaries to pandas DataFrame for final output
-result_df = pd.DataFrame(all_results)
+    return site_results
+
+# Select the GLC collection and band once for each distinct study year, rather than for every site.
+# Missing study years are skipped here, so those sites fail (and are reported) in 'process_site'
+year_map = {int(year): resolve_year(int(year)) for year in df['Study Year'].dropna().unique()}
+
+# Create preallocated arrays for each output column to store results in for output dataframe,
+# sized for every site and stats buffer. Results are written into the next row as they arrive,
+# which avoids keeping a growing list of dictionaries and inferring data types from it at the end
+n_rows = len(df) * len(stats_buffers)
+result_columns = {name: np.empty(n_rows, dtype=dtype) for name, dtype in result_dtypes.items()}
+row_index = 0
+
+# MAIN LOOP FOR ANALYSIS
 
-# Save dataframe as csv to local file
-result_df.to_csv("RESULTS DATASET", index=False)
+# Process study sites in parallel across a pool of workers.
+# Sites are mostly waiting on network requests to GEE, so many sites can be in flight at once.
+# tqdm provides a progress bar in output (for Jupyter environments)
+if USE_PROCESSES:
+    # Each worker process has its own GEE session
+    # Note - relies on the 'fork' start method (default on Linux) when run in Jupyter Notebooks
+    pool = multiprocessing.Pool(N_WORKERS, initializer=init_worker)
+else:
+    # Worker threads share the GEE session initialised above
+    pool = ThreadPool(N_WORKERS)
+
+# Rows at the same location using the same GLC image (e.g. several studies at one restoration site)
+# give identical results, so they are grouped and the raster is fetched and analysed once per group.
+# Rows with missing coordinates or study years are kept (dropna=False), so they fail in 'process_site'
+site_groups = (
+    df.assign(glc_image=df['Study Year'].map(year_map))
+    .groupby(['Longitude', 'Latitude', 'glc_image'], sort=False, dropna=False)
+    .agg(ids=('ID', tuple), year=('Study Year', 'first'))
+    .reset_index()
+)
+
+# Study sites are passed to workers as plain tuples with itertuples, which avoids creating
+# a pandas Series (iterrows) or dictionary for every row
+sites = site_groups[['ids', 'Longitude', 'Latitude', 'year']].itertuples(index=False, name=None)
+
+with pool:
+    site_results_iter = pool.imap_unordered(process_site, sites)
+    for site_results in tqdm(site_results_iter, total=len(site_groups), desc="Processing sites"):
+        # Write each column of the site's rows into the next rows of the result arrays in one go
+        n_site_rows = len(site_results)
+        for column, values in zip(result_columns.values(), zip(*site_results)):
+            column[row_index:row_index + n_site_rows] = values
+        row_index += n_site_rows
+
+# Convert result columns to pandas DataFrame for final output, dropping unused rows from failed sites
+result_df = pd.DataFrame({name: column[:row_index] for name, column in result_columns.items()})
+
+# Round all float columns to 2 decimal places
+float_columns = result_df.select_dtypes('float').columns
+result_df[float_columns] = result_df[float_columns].round(2)
+
+# Save dataframe as Parquet to local file (compressed and keeps column data types, unlike csv)
+# Documentation - https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.to_parquet.html
+result_df.to_parquet("RESULTS DATASET", engine='pyarrow', compression='zstd', index=False)
@@ -0,0 +1,118 @@
+# CHECK OF THE LANDSCAPE METRICS IN 'landscape_metrics.py' AGAINST PYLANDSTATS AND SCIPY
+
+# The workflow calculates its landscape metrics with Numba functions rather than pylandstats.
+# This script compares them on random rasters, with and without the circular no data (0) mask
+# applied to each stats buffer, and fails if any metric differs.
+# Requires the packages in 'requirements-check.txt' ('pip install -r requirements-check.txt'),
+# and is run with 'python check_landscape_metrics.py'
+
+# Import Libraries
+import numpy as np
+import pylandstats as pls
+from scipy.ndimage import label
+import warnings
+
+from landscape_metrics import forest_metrics, contagion
+
+# Supress runtime warnings for a cleaner output (pylandstats warns on rasters with no data)
+warnings.filterwarnings("ignore")
+
+pixel_size = 30
+forest_class = 2
+n_rasters = 50
+
+# Function to generate a random classified raster
+def random_raster(rng, circular_mask):
+    '''
+    Generates a random classified raster with patches of classes 1-10 and scattered single pixels:
+
+    Args:
+    - rng - NumPy random generator
+    - circular_mask - Whether to set pixels outside of a centred circle to 0 (no data), as for the stats buffers
+
+    Returns:
+    - Classified raster (uint8)
+    '''
+    n_blocks = rng.integers(5, 30)
+    block_size = rng.integers(1, 8)
+    n_present = rng.integers(2, 11)
+    blocks = rng.integers(1, n_present + 1, (n_blocks, n_blocks + rng.integers(0, 5)))
+    classified_np = np.kron(blocks, np.ones((block_size, block_size))).astype(np.uint8)
+
+    noise = rng.random(classified_np.shape) < 0.1
+    classified_np[noise] = rng.integers(1, 11, noise.sum())
+
+    if circular_mask:
+        rows, cols = np.indices(classified_np.shape)
+        centre_row, centre_col = (np.array(classified_np.shape) - 1) / 2
+        radius = min(classified_np.shape) / 2
+        classified_np[np.hypot(rows - centre_row, cols - centre_col) > radius] = 0
+
+    return classified_np
+
+# Function to calculate the forest landscape metrics with pylandstats
+def pylandstats_forest_metrics(classified_np):
+    '''
+    Calculates forest patch density, edge density, mean patch area (ha) and largest patch index with pylandstats
+    '''
+    metrics_df = pls.Landscape(classified_np, res=(pixel_size, pixel_size)).compute_class_metrics_df(
+        metrics=['patch_density', 'edge_density', 'area_mn', 'largest_patch_index']
+    )
+    if forest_class not in metrics_df.index:
+        return 0.0, 0.0, 0.0, 0.0
+    forest = metrics_df.loc[forest_class]
+    return (
+        forest['patch_density'],
+        forest['edge_density'],
+        forest['area_mn'],
+        forest['largest_patch_index']
+    )
+
+# Function to calculate the forest patch count and largest patch size with scipy
+def scipy_forest_patches(classified_np):
+    '''
+    Labels forest patches with scipy.ndimage.label (8-cell neighbourhood)
+
+    Returns:
+    - Tuple of (number of forest patches, largest patch size in pixels)
+    '''
+    patch_labels, n_patches = label(classified_np == forest_class, structure=np.ones((3, 3)))
+    if n_patches == 0:
+        return 0, 0
+    return n_patches, np.bincount(patch_labels.ravel())[1:].max()
+
+rng = np.random.default_rng(0)
+metric_names = ['Patch Density', 'Edge Density', 'Mean Patch Area (ha)', 'Largest Patch Index']
+max_differences = dict.fromkeys(metric_names + ['Contagion'], 0.0)
+
+for circular_mask in [False, True]:
+    for _ in range(n_rasters):
+        classified_np = random_raster(rng, circular_mask)
+        n_valid = np.count_nonzero(classified_np)
+
+        metrics = forest_metrics(classified_np, pixel_size)
+        expected_metrics = pylandstats_forest_metrics(classified_np)
+        for name, value, expected in zip(metric_names, metrics, expected_metrics):
+            max_differences[name] = max(max_differences[name], abs(value - expected))
+
+        # Patch count and largest patch (in pixels) back-calculated from patch density and largest patch index
+        n_patches, largest_patch = scipy_forest_patches(classified_np)
+        landscape_area = n_valid * pixel_size * pixel_size
+        assert round(metrics[0] * landscape_area / 1e6) == n_patches
+        assert round(metrics[3] * n_valid / 100) == largest_patch
+
+        # Contagion of all classes (the workflow passes the same class pixel counts for each buffer)
+        class_counts = np.bincount(classified_np.ravel(), minlength=11)
+        contagion_val = contagion(classified_np, class_counts)
+        expected_contagion = pls.Landscape(classified_np, res=(pixel_size, pixel_size)).contagion()
+        max_differences['Contagion'] = max(max_differences['Contagion'], abs(contagion_val - expected_contagion))
+
+# Contagion is NaN for fewer than two classes, as in pylandstats
+single_class = np.full((10, 10), forest_class, dtype=np.uint8)
+assert np.isnan(contagion(single_class, np.bincount(single_class.ravel(), minlength=11)))
+
+for name, difference in max_differences.items():
+    print(f"{name}: maximum difference from pylandstats {difference:.2e}")
+    assert difference < 1e-9, name
+
+print("All landscape metrics match")
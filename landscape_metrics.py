@@ -0,0 +1,191 @@
+# LANDSCAPE METRICS FOR THE SPATIAL ANALYSIS WORKFLOW
+# Kept in a separate module (next to the workflow) so they can be checked against pylandstats
+# without running the workflow, see 'check_landscape_metrics.py'
+
+# Import Libraries
+import numpy as np
+from numba import njit
+
+# Functions compiled with Numba to calculate forest patch and edge statistics in single passes
+# over the classified raster, without creating intermediate mask arrays.
+# These run serially, as sites are already processed in parallel by the worker pool
+# Documentation at - https://numba.readthedocs.io/en/stable/user/jit.html
+@njit(cache=True)
+def _find_patch(parent, pixel):
+    '''
+    Finds the root pixel of the patch containing a pixel (union-find), compressing the path as it goes
+    '''
+    while parent[pixel] != pixel:
+        parent[pixel] = parent[parent[pixel]]
+        pixel = parent[pixel]
+    return pixel
+
+@njit(cache=True)
+def _join_patches(parent, pixel_a, pixel_b):
+    '''
+    Joins the patches containing two neighbouring pixels (union-find)
+    '''
+    root_a = _find_patch(parent, pixel_a)
+    root_b = _find_patch(parent, pixel_b)
+    if root_a < root_b:
+        parent[root_b] = root_a
+    elif root_b < root_a:
+        parent[root_a] = root_b
+
+@njit(cache=True)
+def _forest_patch_sizes(classified_np, forest_class):
+    '''
+    Labels forest patches using the 8-cell neighbourhood with two-pass union-find labelling:
+
+    Returns:
+    - Array of the size (in pixels) of each forest patch
+    '''
+    n_rows, n_cols = classified_np.shape
+    parent = np.empty(n_rows * n_cols, dtype=np.int32)
+
+    # First pass - join each forest pixel to forest neighbours already visited (W, NW, N, NE)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            if classified_np[i, j] != forest_class:
+                continue
+            pixel = i * n_cols + j
+            parent[pixel] = pixel
+            if j > 0 and classified_np[i, j - 1] == forest_class:
+                _join_patches(parent, pixel, pixel - 1)
+            if i > 0:
+                above = pixel - n_cols
+                if j > 0 and classified_np[i - 1, j - 1] == forest_class:
+                    _join_patches(parent, pixel, above - 1)
+                if classified_np[i - 1, j] == forest_class:
+                    _join_patches(parent, pixel, above)
+                if j < n_cols - 1 and classified_np[i - 1, j + 1] == forest_class:
+                    _join_patches(parent, pixel, above + 1)
+
+    # Second pass - count pixels of each patch against its root pixel
+    patch_sizes = np.zeros(n_rows * n_cols, dtype=np.int64)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            if classified_np[i, j] == forest_class:
+                patch_sizes[_find_patch(parent, i * n_cols + j)] += 1
+    return patch_sizes[patch_sizes > 0]
+
+@njit(cache=True)
+def forest_stats(classified_np, forest_class):
+    '''
+    Calculates forest patch and edge pixel statistics for a classified raster (0 as no data):
+
+    Edges are counted between horizontally and vertically adjacent forest and other class pixels
+    (not no data)
+
+    Returns:
+    - Tuple of (number of forest patches, largest patch size, total forest pixels, number of forest edges,
+    number of pixels with data)
+    '''
+    n_rows, n_cols = classified_np.shape
+    n_edges = 0
+    n_valid = 0
+    for i in range(n_rows):
+        for j in range(n_cols):
+            value = classified_np[i, j]
+            if value == 0:
+                continue
+            n_valid += 1
+            is_forest = value == forest_class
+            if j < n_cols - 1:
+                right = classified_np[i, j + 1]
+                if right != 0 and (right == forest_class) != is_forest:
+                    n_edges += 1
+            if i < n_rows - 1:
+                below = classified_np[i + 1, j]
+                if below != 0 and (below == forest_class) != is_forest:
+                    n_edges += 1
+
+    patch_sizes = _forest_patch_sizes(classified_np, forest_class)
+    if patch_sizes.size == 0:
+        return 0, 0, 0, n_edges, n_valid
+    return patch_sizes.size, patch_sizes.max(), patch_sizes.sum(), n_edges, n_valid
+
+@njit(cache=True)
+def class_adjacencies(classified_np, n_classes):
+    '''
+    Counts the adjacencies between each pair of classes in a single pass over the classified raster:
+
+    Horizontally and vertically adjacent pixels are counted in both directions (as in pylandstats),
+    so the adjacency matrix is symmetric
+
+    Returns:
+    - Array (n_classes, n_classes) of adjacency counts, including class 0 (no data)
+    '''
+    n_rows, n_cols = classified_np.shape
+    adjacencies = np.zeros((n_classes, n_classes), dtype=np.int64)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            value = classified_np[i, j]
+            if j < n_cols - 1:
+                right = classified_np[i, j + 1]
+                adjacencies[value, right] += 1
+                adjacencies[right, value] += 1
+            if i < n_rows - 1:
+                below = classified_np[i + 1, j]
+                adjacencies[value, below] += 1
+                adjacencies[below, value] += 1
+    return adjacencies
+
+# Function to calculate the contagion of a buffer
+def contagion(classified_np, class_counts):
+    '''
+    Calculates the contagion (percentage) of the classified raster from its class adjacencies:
+
+    Follows the pylandstats definition used for the original results, 1 - (joint entropy of class
+    adjacencies) / (2 ln(m)), where m is the number of classes present. Unlike the McGarigal (FRAGSTATS)
+    formula, adjacency proportions are not weighted by class area proportions. Adjacencies with no
+    data (0) pixels are excluded. Checked against pylandstats in 'check_landscape_metrics.py'
+    Documentation at - https://pylandstats.readthedocs.io/en/latest/landscape.html
+
+    Args:
+    - classified_np - Classified raster for the buffer, with 0 as no data
+    - class_counts - Pixel count of each class (index 0 as no data) in the buffer
+
+    Returns:
+    - Contagion as a percentage, or NaN if fewer than two classes are present
+    '''
+    n_present = np.count_nonzero(class_counts[1:])
+    if n_present < 2:
+        return np.nan
+
+    adjacencies = class_adjacencies(classified_np, len(class_counts))[1:, 1:].ravel()
+    proportions = adjacencies[adjacencies > 0] / adjacencies.sum()
+    joint_entropy = -np.sum(proportions * np.log(proportions))
+    return float(100 * (1 - joint_entropy / (2 * np.log(n_present))))
+
+# Function to calculate the forest landscape metrics for a buffer
+def forest_metrics(classified_np, pixel_size, forest_class=2):
+    '''
+    Calculates forest patch metrics from the forest patch and edge statistics of the classified raster:
+
+    Only the forest class metrics are used, so this replaces computing the class metrics of every class
+    with pylandstats. Patches use the 8-cell neighbourhood, edges are counted between forest and other
+    classes (not no data), and areas exclude no data (0) pixels, matching the pylandstats definitions
+    Documentation at - https://pylandstats.readthedocs.io/en/latest/landscape.html
+
+    Args:
+    - classified_np - Classified raster for the buffer, with 0 as no data
+    - pixel_size - Pixel size in metres
+    - forest_class - Class value of forest
+
+    Returns:
+    - Tuple of forest (patch density (per 100 ha), edge density (m per ha), mean patch area (ha),
+    largest patch index (%)). All 0.0 if there is no forest in the buffer
+    '''
+    pixel_area = pixel_size * pixel_size
+    n_patches, largest_patch, forest_pixels, n_edges, n_valid = forest_stats(classified_np, forest_class)
+    if n_patches == 0:
+        return 0.0, 0.0, 0.0, 0.0
+
+    landscape_area = n_valid * pixel_area
+    pd_val = n_patches / landscape_area * 1e6
+    ed_val = n_edges * pixel_size / landscape_area * 10000
+    # Convert mean patch area from pixels to hectares (1 ha = 10,000 m^2)
+    mpa_val = forest_pixels / n_patches * pixel_area / 10000
+    lpi_val = 100 * largest_patch / n_valid
+    return float(pd_val), float(ed_val), float(mpa_val), float(lpi_val)